@@ -11,8 +11,9 @@ enable_socks() {
     # First remove any existing DROP or REJECT rules for this port
     sudo iptables -D INPUT -p tcp --dport ${SOCKS_PORT} -j DROP 2>/dev/null || true
     sudo iptables -D INPUT -p tcp --dport ${SOCKS_PORT} -j REJECT 2>/dev/null || true
-    # Add ACCEPT rule
-    sudo iptables -I INPUT -p tcp --dport ${SOCKS_PORT} -j ACCEPT
+    # Add ACCEPT rule below the bot's block list rule so automatic blocks still apply
+    BLOCK_LINE=$(sudo iptables -L INPUT -n --line-numbers | grep "socks_blocklist" | awk '{print $1}' | head -n 1)
+    sudo iptables -I INPUT $((${BLOCK_LINE:-0} + 1)) -p tcp --dport ${SOCKS_PORT} -j ACCEPT
     sudo netfilter-persistent save
     echo "SOCKS proxy is now accessible!"
 }
@@ -22,7 +23,8 @@ disable_socks() {
     echo "Closing SOCKS proxy port ${SOCKS_PORT}..."
 
     # Get the line number of the rule that matches our port
-    LINE=$(sudo iptables -L INPUT -n --line-numbers | grep "dpt:${SOCKS_PORT}" | awk '{print $1}')
+    # Skip the bot's block list and LOG rules
+    LINE=$(sudo iptables -L INPUT -n --line-numbers | grep "dpt:${SOCKS_PORT}" | grep -v -e "socks_blocklist" -e "socks-drop" | awk '{print $1}')
 
     # If we found a matching rule, delete it by line number
     if [ -n "$LINE" ]; then
@@ -12,10 +12,30 @@ if [ "$EUID" -ne 0 ]; then
   exit 1
 fi
 
+# Check the block list prerequisites before touching any rules, so a
+# failure cannot leave the proxy port open
+if ! ls /usr/share/netfilter-persistent/plugins.d/*-ipset >/dev/null 2>&1; then
+  echo "ipset-persistent is not installed, run: apt install ipset ipset-persistent"
+  exit 1
+fi
+if ! modprobe xt_set; then
+  echo "The xt_set kernel module is not available"
+  exit 1
+fi
+if ! ipset create socks_blocklist hash:ip timeout 0 -exist; then
+  echo "Could not create the socks_blocklist ipset"
+  exit 1
+fi
+
 # Clear existing rules for INPUT chain
 echo "Clearing existing INPUT chain rules..."
 iptables -F INPUT
 
+# Drop clients that were temporarily blocked by the bot, ahead of every
+# ACCEPT rule so their established connections are cut off as well
+echo "Adding temporary block list..."
+iptables -I INPUT 1 -p tcp --dport 1080 -m set --match-set socks_blocklist src -j DROP
+
 # Allow established connections
 echo "Adding basic rules..."
 iptables -A INPUT -m state --state ESTABLISHED,RELATED -j ACCEPT
@@ -28,6 +48,8 @@ iptables -A INPUT -p tcp --dport 22 -j ACCEPT
 
 # Block all other incoming connections to the proxy port
 echo "Adding proxy-specific rules..."
+# Log dropped connection attempts (rate limited) so the bot can spot floods
+iptables -A INPUT -p tcp --dport 1080 --syn -m limit --limit 20/second --limit-burst 100 -j LOG --log-prefix "socks-drop: "
 iptables -A INPUT -p tcp --dport 1080 -j DROP
 iptables -A INPUT -p udp --dport 1080 -j DROP
 
@@ -15,7 +15,7 @@ fi
 # Install required packages if not present
 echo "Installing dependencies..."
 apt update
-apt install -y supervisor python3-pip iptables-persistent
+apt install -y supervisor python3-pip iptables-persistent ipset ipset-persistent
 
 # Create log files
 echo "Creating log files..."
@@ -9,12 +9,17 @@ Features:
 - Restart proxy service
 - View logs
 - Check current iptables rules
+- Automatically block abusive clients for a limited time
 """
 
 import os
 import re
+import time
+import asyncio
 import subprocess
+import threading
 import logging
+from collections import OrderedDict, deque
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler, filters, ContextTypes
 
@@ -34,6 +39,35 @@ logger = logging.getLogger(__name__)
 TOKEN = ""  # Your bot token
 AUTHORIZED_USERS = []  # Your Telegram user ID
 
+# Abuse detection configuration
+ABUSE_DETECTION_ENABLED = True
+# Dante messages plus kernel messages from the port 1080 LOG rule
+ABUSE_LOG_COMMAND = [
+    "journalctl", "-f", "-n", "0", "-o", "cat",
+    "_SYSTEMD_UNIT=danted.service", "+", "_TRANSPORT=kernel"
+]
+ABUSE_WINDOW = 60  # Sliding window in seconds
+ABUSE_MAX_FAILURES = 20  # Block after more failed handshakes than this per window
+ABUSE_MAX_CONNECTIONS = 200  # Block after more connections than this per window
+ABUSE_BLOCK_DURATION = 30 * 60  # 30 minutes in seconds
+ABUSE_IDLE_TIMEOUT = 5 * 60  # Forget sources idle for this long
+ABUSE_MAX_TRACKED = 10000  # Upper bound on tracked source IPs
+ABUSE_EXEMPT_IPS = []  # IPs that are never blocked automatically
+ABUSE_MAX_KERNEL_BLOCKS = 5  # New blocks per window from kernel LOG lines alone (0 disables)
+ABUSE_NOTIFY_INTERVAL = 60  # Seconds between block summaries sent to admins
+ABUSE_NOTIFY_MAX_IPS = 10  # IPs listed (with Unblock buttons) per summary
+BLOCK_SET = "socks_blocklist"  # ipset holding temporarily blocked IPs
+NETFILTER_PLUGINS_DIR = "/usr/share/netfilter-persistent/plugins.d"
+
+# Dante client lines, "[:" when a session opens and "]:" when it closes:
+# "pass(1): tcp/accept [: 1.2.3.4.51234 10.0.0.1.1080"
+# "pass(1): tcp/accept ]: 1.2.3.4.51234 10.0.0.1.1080: ..."
+DANTE_LINE_PATTERN = re.compile(
+    r'\b(pass|block)\(\d+\): tcp/accept ([\[\]]): (\d{1,3}(?:\.\d{1,3}){3})\.\d+ (.*)$'
+)
+# Kernel LOG lines from iptables_setup.sh: "socks-drop: IN=eth0 ... SRC=1.2.3.4 ... DPT=1080 ..."
+KERNEL_LINE_PATTERN = re.compile(r'socks-drop: .*\bSRC=(\d{1,3}(?:\.\d{1,3}){3})\b.*\bDPT=1080\b')
+
 def run_command(command):
     """Run shell command and return output."""
     try:
@@ -105,6 +139,8 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await show_logs(update, context)
     elif query.data == "back_to_menu":
         await back_to_menu(update, context)
+    elif query.data.startswith("unblock:"):
+        await unblock_ip(update, context, query.data.split(":", 1)[1])
 
     return ConversationHandler.END
 
@@ -192,13 +228,14 @@ async def check_ip_rules(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def add_ip_rule(update: Update, context: ContextTypes.DEFAULT_TYPE, ip: str) -> None:
     """Add IP to allowed list using iptables."""
     try:
-        # First check if the DROP rule exists
+        # First check if the DROP rule (or the LOG rule in front of it) exists
         stdout, _, _ = run_command(["iptables", "-L", "INPUT", "-n", "--line-numbers"])
         drop_rule_exists = False
         drop_rule_line = 0
         
         for line in stdout.split('\n'):
-            if "DROP" in line and "dpt:1080" in line:
+            # Skip the temporary block list rule so blocks still apply to allowed IPs
+            if ("DROP" in line or "LOG" in line) and "dpt:1080" in line and BLOCK_SET not in line:
                 drop_rule_exists = True
                 drop_rule_line = line.split()[0]  # Get line number
                 break
@@ -341,6 +378,279 @@ async def back_to_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         reply_markup=reply_markup
     )
 
+class AbuseDetector:
+    """Track per-source sliding-window counters and decide when to block."""
+
+    def __init__(self):
+        # ip -> {"last_seen": float, "failures": deque, "connections": deque, "dropped": deque}
+        self.sources = OrderedDict()
+        # ip -> block expiry timestamp, oldest block first
+        self.blocked = OrderedDict()
+        # Times of recent blocks caused by kernel LOG lines alone
+        self.kernel_blocks = deque(maxlen=max(ABUSE_MAX_KERNEL_BLOCKS, 1))
+        # Blocks waiting for the next admin summary
+        self.pending = []
+        self.pending_extra = 0
+        self.lock = threading.Lock()
+
+    def parse_line(self, line):
+        """Return (ip, "connection", "failure" or "dropped") for a client line, or None."""
+        match = DANTE_LINE_PATTERN.search(line)
+        if match:
+            verdict, bracket, ip, rest = match.groups()
+            if bracket == "[":
+                return ip, "connection"
+            if verdict == "block" or "error" in rest:
+                return ip, "failure"
+            return None
+        match = KERNEL_LINE_PATTERN.search(line)
+        if match:
+            return match.group(1), "dropped"
+        return None
+
+    def record(self, ip, kind, now=None):
+        """Record an event of the given kind for ip and return True if it should be blocked."""
+        if ip in ABUSE_EXEMPT_IPS:
+            return False
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            expiry = self.blocked.get(ip)
+            if expiry is not None:
+                if expiry > now:
+                    return False
+                del self.blocked[ip]
+
+            self._evict(now)
+
+            entry = self.sources.get(ip)
+            if entry is None:
+                entry = {
+                    "last_seen": now,
+                    "failures": deque(maxlen=ABUSE_MAX_FAILURES + 1),
+                    "connections": deque(maxlen=ABUSE_MAX_CONNECTIONS + 1),
+                    "dropped": deque(maxlen=ABUSE_MAX_CONNECTIONS + 1),
+                }
+                self.sources[ip] = entry
+            entry["last_seen"] = now
+            self.sources.move_to_end(ip)
+
+            # Each deque holds at most threshold + 1 timestamps, so a full deque
+            # whose oldest entry is still inside the window means the limit was exceeded
+            events = entry[{"failure": "failures", "dropped": "dropped"}.get(kind, "connections")]
+            events.append(now)
+            if len(events) < events.maxlen or now - events[0] > ABUSE_WINDOW:
+                return False
+
+            # Kernel lines are single SYNs whose source is easily spoofed and
+            # which are dropped anyway, so only allow a few such blocks per window
+            if kind == "dropped":
+                budget = self.kernel_blocks
+                if ABUSE_MAX_KERNEL_BLOCKS < 1 or (
+                        len(budget) == budget.maxlen and now - budget[0] <= ABUSE_WINDOW):
+                    return False
+                budget.append(now)
+
+            del self.sources[ip]
+            self.blocked[ip] = now + ABUSE_BLOCK_DURATION
+            return True
+
+    def release(self, ip):
+        """Forget that ip is blocked."""
+        with self.lock:
+            self.blocked.pop(ip, None)
+
+    def queue_notification(self, ip):
+        """Add ip to the next admin summary."""
+        with self.lock:
+            if len(self.pending) < ABUSE_NOTIFY_MAX_IPS:
+                self.pending.append(ip)
+            else:
+                self.pending_extra += 1
+
+    def take_notifications(self):
+        """Return and clear the IPs and count of extra blocks for the next summary."""
+        with self.lock:
+            pending, extra = self.pending, self.pending_extra
+            self.pending, self.pending_extra = [], 0
+        return pending, extra
+
+    def _evict(self, now):
+        """Drop idle sources and expired blocks, keeping both maps bounded."""
+        # Blocks all share one duration, so insertion order is expiry order
+        while self.blocked:
+            ip, expiry = next(iter(self.blocked.items()))
+            if expiry > now and len(self.blocked) < ABUSE_MAX_TRACKED:
+                break
+            del self.blocked[ip]
+
+        while self.sources:
+            ip, entry = next(iter(self.sources.items()))
+            if now - entry["last_seen"] < ABUSE_IDLE_TIMEOUT and len(self.sources) < ABUSE_MAX_TRACKED:
+                break
+            del self.sources[ip]
+
+abuse_detector = AbuseDetector()
+notifier_task = None
+
+def has_ipset_persistence():
+    """Check that netfilter-persistent also saves and restores ipsets."""
+    try:
+        plugins = os.listdir(NETFILTER_PLUGINS_DIR)
+    except OSError:
+        return False
+    return any(plugin.endswith("-ipset") for plugin in plugins)
+
+def ensure_block_set():
+    """Create the block ipset and the iptables rule that drops its members."""
+    # Without the ipset plugin a saved rule would reference a set that is
+    # missing at boot, iptables-restore would fail and leave port 1080 open
+    if not has_ipset_persistence():
+        return "ipset-persistent is not installed"
+
+    stdout, stderr, returncode = run_command([
+        "ipset", "create", BLOCK_SET, "hash:ip", "timeout", "0", "-exist"
+    ])
+    if returncode != 0:
+        return stderr
+
+    rule = ["INPUT", "-p", "tcp", "--dport", "1080",
+            "-m", "set", "--match-set", BLOCK_SET, "src", "-j", "DROP"]
+
+    # The rule must be first so blocks also cut off established connections
+    stdout, stderr, returncode = run_command(["iptables", "-L", "INPUT", "-n", "--line-numbers"])
+    if returncode != 0:
+        return stderr
+    if "socks-drop" not in stdout:
+        logger.warning("socks-drop LOG rule is missing, re-run iptables_setup.sh to detect floods from other IPs")
+    for line in stdout.split('\n'):
+        if BLOCK_SET in line:
+            if line.split()[0] == "1":
+                return None
+            # Found further down the chain, move it to the top
+            _, stderr, returncode = run_command(["iptables", "-D"] + rule)
+            if returncode != 0:
+                return stderr
+            break
+
+    _, stderr, returncode = run_command(["iptables", "-I"] + rule[:1] + ["1"] + rule[1:])
+    if returncode != 0:
+        return stderr
+    return None
+
+def block_ip(ip):
+    """Add ip to the block set; the kernel removes it once the timeout expires."""
+    return run_command([
+        "ipset", "add", BLOCK_SET, ip, "timeout", str(ABUSE_BLOCK_DURATION), "-exist"
+    ])
+
+async def notify_blocks(application: Application) -> None:
+    """Send authorized users one summary of new automatic blocks per interval."""
+    minutes = ABUSE_BLOCK_DURATION // 60
+
+    while True:
+        await asyncio.sleep(ABUSE_NOTIFY_INTERVAL)
+
+        ips, extra = abuse_detector.take_notifications()
+        if not ips:
+            continue
+
+        keyboard = [
+            [InlineKeyboardButton(f"🔓 Unblock {ip}", callback_data=f"unblock:{ip}")]
+            for ip in ips
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+
+        text = (f"🚫 Blocked for {minutes} minutes after exceeding connection "
+                f"limits on port 1080:\n" + "\n".join(ips))
+        if extra:
+            text += f"\n...and {extra} more"
+
+        for user_id in AUTHORIZED_USERS:
+            try:
+                await application.bot.send_message(
+                    chat_id=user_id,
+                    text=text,
+                    reply_markup=reply_markup
+                )
+            except Exception as e:
+                logger.error(f"Failed to notify user {user_id}: {e}")
+
+def watch_logs() -> None:
+    """Follow the proxy log stream and block sources that exceed the limits."""
+    while True:
+        try:
+            process = subprocess.Popen(
+                ABUSE_LOG_COMMAND,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True
+            )
+            try:
+                for line in process.stdout:
+                    event = abuse_detector.parse_line(line)
+                    if event is None:
+                        continue
+
+                    ip, kind = event
+                    if not abuse_detector.record(ip, kind):
+                        continue
+
+                    stdout, stderr, returncode = block_ip(ip)
+                    if returncode != 0:
+                        abuse_detector.release(ip)
+                        logger.error(f"Failed to block IP {ip}: {stderr}")
+                        continue
+
+                    logger.info(f"Blocked IP {ip} for {ABUSE_BLOCK_DURATION} seconds")
+                    abuse_detector.queue_notification(ip)
+            finally:
+                # Never leave a journalctl follower behind when restarting
+                process.kill()
+                process.wait()
+            logger.warning(f"Log stream exited with code {process.returncode}, restarting")
+        except Exception as e:
+            logger.error(f"Error reading log stream: {str(e)}")
+
+        time.sleep(5)
+
+async def start_abuse_detection(application: Application) -> None:
+    """Start the log watcher thread once the bot is initialized."""
+    if not ABUSE_DETECTION_ENABLED:
+        return
+
+    if ABUSE_MAX_FAILURES < 1 or ABUSE_MAX_CONNECTIONS < 1:
+        logger.error("Abuse detection disabled, ABUSE_MAX_FAILURES and ABUSE_MAX_CONNECTIONS must be at least 1")
+        return
+
+    error = ensure_block_set()
+    if error:
+        logger.error(f"Abuse detection disabled, could not set up block set: {error}")
+        return
+
+    global notifier_task
+
+    threading.Thread(target=watch_logs, daemon=True).start()
+    # Keep a reference so the task is not garbage collected
+    notifier_task = asyncio.get_running_loop().create_task(notify_blocks(application))
+    logger.info("Abuse detection started")
+
+async def unblock_ip(update: Update, context: ContextTypes.DEFAULT_TYPE, ip: str) -> None:
+    """Remove ip from the temporary block set."""
+    query = update.callback_query
+
+    stdout, stderr, returncode = run_command(["ipset", "del", BLOCK_SET, ip, "-exist"])
+
+    # Reply instead of editing so the summary keeps its other Unblock buttons
+    if returncode != 0:
+        await query.message.reply_text(f"Error unblocking IP {ip}: {stderr}")
+        logger.error(f"Error unblocking IP {ip}: {stderr}")
+    else:
+        abuse_detector.release(ip)
+        await query.message.reply_text(f"✅ IP {ip} has been unblocked.")
+        logger.info(f"Unblocked IP {ip} by user {update.effective_user.id}")
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancel conversation."""
     await update.message.reply_text(
@@ -351,7 +661,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 def main() -> None:
     """Start the bot."""
     # Create the Application
-    application = Application.builder().token(TOKEN).build()
+    application = Application.builder().token(TOKEN).post_init(start_abuse_detection).build()
 
     # Add conversation handler for IP operations
     conv_handler = ConversationHandler(